@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-15 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_name', models.CharField(max_length=50)),
+                ('last_name', models.CharField(max_length=50)),
+                ('email', models.EmailField(max_length=254)),
+                ('username', models.CharField(max_length=100, unique=True)),
+                ('date_joined', models.DateTimeField(auto_now_add=True)),
+                ('age', models.PositiveSmallIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_name', models.CharField(max_length=50)),
+                ('last_name', models.CharField(max_length=50)),
+                ('username', models.CharField(max_length=100, unique=True)),
+                ('email', models.EmailField(db_index=True, max_length=254)),
+                ('date_joined', models.DateTimeField(auto_now_add=True)),
+                ('age', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('is_adult', models.GeneratedField(db_persist=True, expression=models.Q(('age__gte', 18), ('age__isnull', False)), output_field=models.BooleanField())),
+            ],
+            options={
+                'verbose_name': 'User',
+                'verbose_name_plural': 'Users',
+                'ordering': ['-date_joined'],
+                'indexes': [models.Index(fields=['last_name', 'first_name'], name='user_name_idx'), models.Index(fields=['is_adult'], name='user_is_adult_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('username', ''), _negated=True), name='user_username_nonempty')],
+            },
+        ),
+    ]
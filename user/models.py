@@ -1,24 +1,126 @@
-from django.db import models
+from functools import partial
+
+from django.core.cache import cache
+from django.db import connections, models, transaction
 from django.utils.functional import cached_property
 
+# django-fast-update is optional, without it bulk_set_age() falls back to bulk_update()
+# https://github.com/netzkolchose/django-fast-update
+try:
+    from fast_update.copy import copy_update
+    from fast_update.fast import fast_update
+except ImportError:
+    copy_update = fast_update = None
+
+USER_COUNT_CACHE_KEY = 'user:count'
+USER_COUNT_CACHE_TTL = 30  # seconds, exact freshness of the count is rarely needed
+_USER_REPR = "User(id={}, username={})".format  # bound once, __repr__ skips the str.format lookup per call
+PREFETCH_CHUNK_SIZE = 900  # stays under SQLite's 999 parameter limit and keeps IN lists index friendly
+
+
+def clear_user_count(using=None):
+    # Deferred to commit: clearing inside the transaction would let a concurrent get_user_count() re-cache the
+    # pre-commit count for the whole TTL, and a rollback would clear it for nothing
+    transaction.on_commit(partial(cache.delete, USER_COUNT_CACHE_KEY), using=using)
+
+
+# ===================================================================================MANAGERS==============================================================================
+# Managers are the interface through which database queries are made, every model has at least one (objects)
+# A custom manager can add table-level methods or change the initial queryset
+# https://docs.djangoproject.com/en/5.2/topics/db/managers/
+class UserManager(models.Manager):
+    # Relations to load alongside each user, so templates looping over users don't issue one query per row (N+1)
+    # FKs/OneToOnes go in select_related (one JOIN), M2M/reverse FKs in prefetch_related (one extra query per relation)
+    # e.g select_related_fields = ('profile',) and prefetch_related_fields = (Prefetch('groups', queryset=Group.objects.only('id', 'name')),)
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    def with_related(self):
+        qs = self.get_queryset()
+        if self.select_related_fields:
+            qs = qs.select_related(*self.select_related_fields)
+        if self.prefetch_related_fields:
+            qs = qs.prefetch_related(*self.prefetch_related_fields)
+        return qs
+        # queried as User.objects.with_related() e.g User.objects.with_related().filter(age__gte=18)
+
+    def older_than(self, age):
+        return self.get_queryset().filter(age__gt=age)  # NULL ages never match, same as is_older_than()
+        # queried as User.objects.older_than(10)
+
+    def prefetch_chunked(self, users, related_queryset, fk_name, to_attr, chunk_size=PREFETCH_CHUNK_SIZE):
+        """
+        Like prefetch_related() for a reverse FK, but splits the WHERE fk IN (...) query into chunks of chunk_size ids.
+        Each user gets a list of its related objects on to_attr, the same way Prefetch(to_attr=...) does.
+        """
+        users = list(users)
+        by_id = {}
+        for user in users:
+            if user.pk is None:
+                setattr(user, to_attr, [])  # unsaved users can't have related rows, keep None out of the IN list
+                continue
+            # setdefault so copies of the same user (e.g from a join) share one list instead of orphaning the first
+            setattr(user, to_attr, by_id.setdefault(user.pk, []))
+        ids = list(by_id)
+        attname = related_queryset.model._meta.get_field(fk_name).attname
+        for start in range(0, len(ids), chunk_size):
+            for obj in related_queryset.filter(**{f'{fk_name}__in': ids[start:start + chunk_size]}):
+                by_id[getattr(obj, attname)].append(obj)
+        return users
+        # queried as User.objects.prefetch_chunked(User.objects.all(), Order.objects.all(), 'user', 'orders')
+
+
+# A narrow projection for list views: only the columns shown when a user is rendered are selected,
+# the rest (email, date_joined) are deferred and loaded on first access
+# Opt-in only, never make it the base manager: refresh_from_db() goes through the base manager and would
+# silently skip the deferred columns. For related access pass Prefetch('profiles', queryset=UserProfile.slim.all())
+class SlimUserManager(models.Manager):
+    slim_fields = ('id', 'username', 'first_name', 'last_name', 'age')
+
+    def get_queryset(self):
+        return super().get_queryset().only(*self.slim_fields)
+
 
 # Basic model structure
 class User(models.Model):
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
-    username = models.CharField(max_length=100)
-    email = models.EmailField()
+    username = models.CharField(max_length=100, unique=True)  # unique also creates the index used by username lookups
+    email = models.EmailField(db_index=True)
     date_joined = models.DateTimeField(auto_now_add=True)
-    age = models.PositiveIntegerField(null=True, blank=True)
+    age = models.PositiveSmallIntegerField(null=True, blank=True)  # ages fit in 2 bytes, halves the column width
+    # Computed by the database from age, so it can be filtered and indexed without loading age into Python
+    # NULL ages are adults=False, not NULL, because of the isnull check
+    # The value only exists once the row is saved: reading it on an unsaved instance (e.g from UserRow.to_model()
+    # or make_factory(commit=False)) raises AttributeError, check age directly before bulk_create if you need it
+    is_adult = models.GeneratedField(
+        expression=models.Q(age__isnull=False, age__gte=18),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
+
+    objects = UserManager()
 
 # ====================================================================================META CLASS===========================================================================
 # Meta class is used to define metadata for the model
 # such as ordering, verbose name, and other options
 # https://docs.djangoproject.com/en/5.2/ref/models/options/
     class Meta:
+        # Plain str on purpose: this app isn't translated, so there is no lazy gettext proxy to resolve on every admin render
+        # To translate later use pgettext_lazy("user model", "User") from django.utils.translation, the context avoids collisions
         verbose_name = "User"
         verbose_name_plural = "Users"
         ordering = ['-date_joined']  # Default ordering by date joined, newest first
+        indexes = [
+            models.Index(fields=['last_name', 'first_name'], name='user_name_idx'),  # name searches
+            models.Index(fields=['is_adult'], name='user_is_adult_idx'),
+        ]
+        # Enforced by the database, so bulk_create/update paths that skip clean() are covered too
+        # full_clean() still checks them in Python through validate_constraints()
+        # age needs no constraint here, PositiveSmallIntegerField already adds a CHECK (age >= 0)
+        constraints = [
+            models.CheckConstraint(condition=~models.Q(username=''), name='user_username_nonempty'),
+        ]
 
 # =========================================================================================================================================================================
 # =================================================================================MODEL METHODS==============================================================================
@@ -37,51 +139,61 @@ class User(models.Model):
 # ===============================================================================__str__ & __repr__=======================================================================
 # __str__ is used to define the string representation of the model instance
     def __str__(self):
-        return self.username or f"{self.first_name} {self.last_name}"
+        return self.full_name
         # queried as str(User) e.g str(User.objects.first())
 # __repr__ is used to define the official string representation of the model instance
     def __repr__(self):
-        return f"User(id={self.id}, username={self.username})"
+        return _USER_REPR(self.id, self.username)
         # queried as repr(User) e.g repr(User.objects.first())
 
 # ===============================================================================Property Methods========================================================================
 # Used for computed fields that should behave like attributes
 # Evaluated when accessed(after data has been fetched from the database), not stored in the database
-    @property
+# full_name is cached per instance since templates call it once per row, save() drops the cached value
+    @cached_property
     def full_name(self):
-        return f"{self.first_name} {self.last_name}" or f"{self.username}"
+        fn, ln = self.first_name, self.last_name
+        if fn and ln:
+            return fn + ' ' + ln
+        return fn or ln or self.username
         # queried as User.objects.all().<method_name>() e.g User.objects.all().get_full_name()
 # Cached property methods can be used to store the result of a computation
-    @cached_property
-    def is_adult(self):
-        return self.age is not None and self.age >= 18
-        # queried as User.objects.all().<method_name>() e.g User.objects.all().is_adult()
-    
+# is_adult used to be one, it is now a GeneratedField so filter in SQL instead of looping in Python:
+# queried as User.objects.filter(is_adult=True)
+
     def invalidate_cache(self):
         """
-        Invalidate the cached property.
+        Invalidate the cached properties.
         This is useful if the underlying data changes and you want to refresh the cached value.
         """
-        if hasattr(self, 'is_adult'):
-            del self.is_adult
+        # cached_property stores its value in the instance __dict__, popping it avoids hasattr(),
+        # which would run the property and fill the cache we are trying to clear
+        self.__dict__.pop('full_name', None)
         # This will remove the cached property, forcing it to be recalculated next time it's accessed
 
 # ===============================================================================Instance Methods========================================================================
 # For operations on individual records
 # these are methods that can be called on the model instance
     def get_full_name(self):
-        return f"{self.first_name} {self.last_name}" or f"{self.username}"
+        return self.full_name
     
     def is_older_than(self, age):
-        return self.age is not None and self.age > age
+        own_age = self.age  # read the attribute once
+        return own_age is not None and own_age > age
         # queried as User.objects.all().<method_name>() e.g User.objects.all().is_older_than(10)
+        # to select users by age use User.objects.older_than(10), it filters in SQL instead of a Python loop
 
 # ===============================================================================Static Methods========================================================================
 # For operations that don't require an instance
 # These methods are not tied to a specific instance of the model
     @staticmethod
     def get_user_count():
-        return User.objects.count()
+        # COUNT(*) is a full scan on large tables, so the result is cached for a short TTL
+        count = cache.get(USER_COUNT_CACHE_KEY)
+        if count is None:
+            count = User.objects.count()
+            cache.set(USER_COUNT_CACHE_KEY, count, USER_COUNT_CACHE_TTL)
+        return count
         # queried as User.get_user_count() e.g User.get_user_count()
 # ==============================================================================Class Methods=========================================================================
 # For operations that need to access the model class itself
@@ -89,29 +201,104 @@ class User(models.Model):
 # These operate on the model class itself, useful for alternative constructors:
     @classmethod
     def create_user(cls, username, first_name=None, last_name=None, email=None):
+        """
+        Create and save a single user.
+        For batch jobs (hundreds of rows or more) use bulk_create_users() instead,
+        this issues one INSERT and one transaction per call.
+        """
         return cls.objects.create(username=username, first_name=first_name, last_name=last_name, email=email)
         # queried as User.create_user('new_user') e.g User.create_user()
 
+    @classmethod
+    def make_factory(cls, commit=True, **fixed):
+        """
+        Return a function that creates users sharing the fixed field values, e.g make_factory(email='x@y.z').
+        The create function is bound once, so scripted loops skip create_user's per-call argument defaulting.
+        With commit=False the factory returns unsaved instances, flush them with one bulk_create_users() call.
+        Unsaved instances have no is_adult yet, it is generated by the database on insert.
+        """
+        make = cls.objects.create if commit else cls
+
+        def factory(username, **kwargs):
+            return make(username=username, **fixed, **kwargs)
+        return factory
+        # queried as factory = User.make_factory(commit=False, email='x@y.z'); User.bulk_create_users([factory(u) for u in names])
+
+    @classmethod
+    def bulk_create_users(cls, rows, batch_size=10_000):
+        """
+        Create many users from an iterable of field dicts or unsaved User instances in batched INSERTs inside a single transaction.
+        bulk_create skips save() and signals (auto_now_add still fills date_joined), so the count cache is cleared here,
+        use this rather than User.objects.bulk_create() directly.
+        Inserting assigns pks, which changes the hash of every staged instance: key staging dicts/sets by username,
+        not by the User objects themselves, or lookups in them silently miss afterwards.
+        """
+        objs = [row if isinstance(row, cls) else cls(**row) for row in rows]
+        with transaction.atomic():
+            created = cls.objects.bulk_create(objs, batch_size=batch_size, ignore_conflicts=False)
+            clear_user_count()
+        return created
+        # queried as User.bulk_create_users([{'username': 'a'}, {'username': 'b'}]) or User.bulk_create_users([User(username='a')])
+
+    @classmethod
+    def bulk_set_age(cls, pairs, batch_size=50_000):
+        """
+        Set age for many users from (id, age) pairs without fetching them first.
+        Uses one UPDATE ... FROM VALUES per batch (COPY + UPDATE FROM on Postgres) instead of
+        bulk_update's CASE WHEN. Skips clean(), only meant for trusted internal callers.
+        """
+        objs = [cls(pk=pk, age=age) for pk, age in pairs]
+        qs = cls.objects.all()
+        if fast_update is None:
+            return qs.bulk_update(objs, ['age'], batch_size=batch_size)
+        if connections[qs.db].vendor == 'postgresql':
+            return copy_update(qs, objs, ['age'])
+        return fast_update(qs, objs, ['age'], batch_size)
+        # queried as User.bulk_set_age([(1, 30), (2, 41)])
+
+# Existence and id-only helpers never build full User rows, only the columns they need cross the wire
+    @classmethod
+    def exists_username(cls, username):
+        return cls.objects.filter(username=username).exists()  # exists() selects a constant, not the row
+        # queried as User.exists_username('new_user')
+
+    @classmethod
+    def ids(cls):
+        return list(cls.objects.order_by().values_list('id', flat=True))  # order_by() skips the Meta ordering sort
+        # queried as User.ids()
+
+# Prefer stream() over looping on User.objects.all(): all() caches every row in memory, iterator() yields them in chunks
+# and on Postgres reads through a server-side cursor, so memory stays flat however big the table gets
+# order_by() drops the Meta ordering, sorting on the unindexed date_joined would make the database sort the whole table first
+# The projection covers str()/full_name, date_joined and age are deferred so don't tuple() the rows (one query per row)
+    stream_fields = ('id', 'username', 'email', 'first_name', 'last_name')
+
+    @classmethod
+    def stream(cls, chunk_size=2000):
+        yield from cls.objects.order_by().only(*cls.stream_fields).iterator(chunk_size=chunk_size)
+        # queried as for user in User.stream(): ...
+
 # =============================================================================Lifecycle Methods=========================================================================
 # These methods are called at specific points in the object's lifecycle
 # Examples include:
 # - `save()` is called before an object is saved to the database
 # - `delete()` is called before an object is deleted from the database
+# Only override them when they do real work, a pass-through override just adds a Python frame per write
+# Hooks that aren't about the instance itself (e.g clearing the user count cache) live in signals.py instead,
+# they have a dispatch_uid so bulk jobs can disconnect them, and post_delete also fires for QuerySet.delete()
     def save(self, *args, **kwargs):
-        # Custom logic before saving
+        updating = not self._state.adding
+        update_fields = kwargs.get('update_fields')
+        self.invalidate_cache()  # fields may have changed, drop the cached properties
         super().save(*args, **kwargs)  # Call the original save method
+        if updating and (update_fields is None or 'age' in update_fields):
+            # INSERT returns is_adult but UPDATE doesn't, drop the stale value so the next access reloads it
+            self.__dict__.pop('is_adult', None)
 
-    def delete(self, *args, **kwargs):
-        # Custom logic before deleting
-        super().delete(*args, **kwargs)  # Call the original delete method
-    
-    def clean(self):
-        # Custom validation logic before saving
-        if not self.username:
-            raise ValueError("Username cannot be empty")
-        if self.age is not None and self.age < 0:
-            raise ValueError("Age cannot be negative")
-        super().clean()
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.invalidate_cache()  # reloaded fields make the cached properties stale
+# clean() is not overridden, its checks (non-empty username, non-negative age) are database constraints, see Meta
 
 # =============================================================================Meta Methods===============================================================================
 # Comparison methods allow you to define how model instances are compared
@@ -119,7 +306,9 @@ class User(models.Model):
     def __eq__(self, other):
         if not isinstance(other, User):
             return NotImplemented
-        return self.id == other.id
+        if self.pk is None or other.pk is None:
+            return self is other  # unsaved instances are only equal to themselves
+        return self.pk == other.pk
     def __lt__(self, other):
         if not isinstance(other, User):
             return NotImplemented
@@ -128,12 +317,39 @@ class User(models.Model):
 
 # Hash and iter methods allow you to define how model instances are hashed and iterated
     def __hash__(self):
-        return hash(self.id)
+        # Unsaved instances would all hash to hash(None), hash by identity instead so sets/dicts of them stay O(1)
+        # The hash changes once the instance gets a pk (save() or bulk_create_users()), so don't stage unsaved users
+        # in a set or as dict keys across the insert, key them by username instead
+        return hash(self.pk) if self.pk is not None else id(self) >> 4
     
+    _iter_fields = ('first_name', 'last_name', 'username', 'email', 'date_joined', 'age')  # built once, not per call
+
     def __iter__(self):
-        yield from (self.first_name, self.last_name, self.username, self.email, self.date_joined, self.age)
         # This allows you to iterate over the model instance like a tuple
-        return iter((self.first_name, self.last_name, self.username, self.email, self.date_joined, self.age))
+        # Loaded field values live in the instance __dict__, deferred ones fall back to getattr() which fetches them
+        d = self.__dict__
+        for name in self._iter_fields:
+            yield d[name] if name in d else getattr(self, name)
+
+# ==========================================================================VALUE OBJECTS (PLAIN PYTHON)==================================================================
+# Model instances can't use __slots__, but plain helper classes used next to them can
+# __slots__ replaces the per-instance __dict__ with fixed slots, so each object is smaller and attribute access is faster
+# Useful when an ingest job holds many rows in memory before handing them to User.bulk_create_users()
+# For dedup while staging key rows by username, e.g rows = {row.username: row}, model instances change hash once inserted
+class UserRow:
+    __slots__ = ('first_name', 'last_name', 'username', 'email', 'age')
+
+    def __init__(self, username, first_name='', last_name='', email='', age=None):
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.email = email
+        self.age = age
+
+    def to_model(self):
+        # The User is unsaved, so its is_adult GeneratedField can't be read until it has been inserted
+        return User(**{name: getattr(self, name) for name in self.__slots__})
+        # queried as User.bulk_create_users([row.to_model() for row in rows])
 
 # ======================================================================================================================================================================
 # =========================================================================MODEL INHERITANCE=============================================================================
@@ -160,7 +376,10 @@ class BaseUser(models.Model):
 class UserProfile(BaseUser):
     username = models.CharField(max_length=100, unique=True)
     date_joined = models.DateTimeField(auto_now_add=True)
-    age = models.PositiveIntegerField(null=True, blank=True)
+    age = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    objects = models.Manager()  # declared first so it stays the default manager
+    slim = SlimUserManager()  # queried as UserProfile.slim.all()
 
 # ==========================================================================MULTI-TABLE INHERITANCE===========================================================================
 # Multi-table inheritance allows you to create a base model that is stored in its own table,
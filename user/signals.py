@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User, clear_user_count
+
+
+# Signals let hooks run on save/delete without overriding the model methods
+# dispatch_uid keeps a receiver from being connected twice and lets bulk jobs disconnect it by uid, e.g
+# post_save.disconnect(sender=User, dispatch_uid='user_count_on_save')
+# https://docs.djangoproject.com/en/5.2/topics/signals/
+@receiver(post_save, sender=User, dispatch_uid='user_count_on_save')
+def clear_user_count_on_save(sender, instance, created, using, **kwargs):
+    if created:
+        clear_user_count(using)  # a new row changes the cached count
+
+
+@receiver(post_delete, sender=User, dispatch_uid='user_count_on_delete')
+def clear_user_count_on_delete(sender, instance, using, **kwargs):
+    clear_user_count(using)
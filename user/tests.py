@@ -1,3 +1,299 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_save
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .models import USER_COUNT_CACHE_KEY, User, UserProfile, UserRow
+from .signals import clear_user_count_on_save
+
+
+class UserProfileManagerTests(TestCase):
+    def test_refresh_from_db_reloads_every_column(self):
+        profile = UserProfile.objects.create(username='p', first_name='a', last_name='b', email='orig@x.z', age=3)
+        UserProfile.objects.filter(pk=profile.pk).update(email='new@x.z', age=4)
+        profile.refresh_from_db()
+        self.assertEqual(profile.email, 'new@x.z')
+        self.assertEqual(profile.age, 4)
+
+    def test_slim_manager_defers_unlisted_columns(self):
+        UserProfile.objects.create(username='p', first_name='a', last_name='b', email='e@x.z')
+        profile = UserProfile.slim.get()
+        self.assertEqual(profile.get_deferred_fields(), {'email', 'date_joined'})
+
+
+class PrefetchChunkedTests(TestCase):
+    # User's own pk stands in for a reverse FK, so each user's related list should hold just itself
+    def prefetch(self, users, chunk_size=900):
+        return User.objects.prefetch_chunked(users, User.objects.all(), 'id', 'same', chunk_size=chunk_size)
+
+    def test_splits_ids_into_chunks(self):
+        User.bulk_create_users([{'username': f'u{i}'} for i in range(5)])
+        users = list(User.objects.all())
+        with self.assertNumQueries(3):  # 5 ids in chunks of 2
+            self.prefetch(users, chunk_size=2)
+        for user in users:
+            self.assertEqual(user.same, [user])
+
+    def test_duplicate_users_share_one_list(self):
+        User.bulk_create_users([{'username': 'a'}])
+        first, second = self.prefetch([User.objects.get(), User.objects.get()])
+        self.assertEqual(len(first.same), 1)
+        self.assertIs(first.same, second.same)
+
+    def test_unsaved_users_are_skipped(self):
+        User.bulk_create_users([{'username': 'a'}])
+        users = [User.objects.get(), User(username='b')]
+        with self.assertNumQueries(1):
+            saved, unsaved = self.prefetch(users)
+        self.assertEqual(saved.same, [saved])
+        self.assertEqual(unsaved.same, [])
+
+
+class UserCountCacheTests(TestCase):
+    # The cache is cleared on commit, captureOnCommitCallbacks runs those callbacks inside the test transaction
+    def setUp(self):
+        cache.delete(USER_COUNT_CACHE_KEY)
+
+    def test_count_is_cached(self):
+        User.bulk_create_users([{'username': 'a'}])
+        self.assertEqual(User.get_user_count(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(User.get_user_count(), 1)
+
+    def test_count_follows_create_and_bulk_create(self):
+        self.assertEqual(User.get_user_count(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create(username='a')
+        self.assertEqual(User.get_user_count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.bulk_create_users([{'username': 'b'}, {'username': 'c'}])
+        self.assertEqual(User.get_user_count(), 3)
+
+    def test_count_is_cleared_only_on_commit(self):
+        self.assertEqual(User.get_user_count(), 0)
+        with self.captureOnCommitCallbacks() as callbacks:
+            User.bulk_create_users([{'username': 'a'}])
+            self.assertEqual(User.get_user_count(), 0)  # not committed yet, the cached count stays
+        self.assertEqual(len(callbacks), 1)
+
+    def test_rollback_keeps_the_cached_count(self):
+        self.assertEqual(User.get_user_count(), 0)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                User.objects.create(username='a')
+                User.objects.create(username='a')  # duplicate username rolls the block back
+        self.assertEqual(callbacks, [])
+
+    def test_updating_a_user_keeps_the_cached_count(self):
+        user = User.objects.create(username='a')
+        self.assertEqual(User.get_user_count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.age = 30
+            user.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(User.get_user_count(), 1)
+
+
+class UserCountSignalTests(TestCase):
+    def setUp(self):
+        cache.delete(USER_COUNT_CACHE_KEY)
+        User.bulk_create_users([{'username': 'a'}, {'username': 'b'}, {'username': 'c'}])
+
+    def test_instance_delete_clears_count(self):
+        self.assertEqual(User.get_user_count(), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(username='a').delete()
+        self.assertEqual(User.get_user_count(), 2)
+
+    def test_queryset_delete_clears_count(self):
+        self.assertEqual(User.get_user_count(), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(username__in=['a', 'b']).delete()
+        self.assertEqual(User.get_user_count(), 1)
+
+    def test_receivers_can_be_disconnected_by_uid(self):
+        self.assertEqual(User.get_user_count(), 3)
+        self.assertTrue(post_save.disconnect(sender=User, dispatch_uid='user_count_on_save'))
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                User.objects.create(username='d')
+            self.assertEqual(User.get_user_count(), 3)  # still the cached value
+        finally:
+            post_save.connect(clear_user_count_on_save, sender=User, dispatch_uid='user_count_on_save')
+
+
+class UserIsAdultTests(TestCase):
+    def test_value_after_insert(self):
+        self.assertTrue(User.objects.create(username='a', age=30).is_adult)
+        self.assertFalse(User.objects.create(username='b', age=10).is_adult)
+        self.assertFalse(User.objects.create(username='c').is_adult)  # NULL age is not adult
+
+    def test_reloaded_after_age_changes_on_update(self):
+        user = User.objects.create(username='a', age=30)
+        self.assertTrue(user.is_adult)
+        user.age = 10
+        user.save()
+        self.assertFalse(user.is_adult)
+
+    def test_unsaved_instance_has_no_value(self):
+        for user in (User(username='a', age=30), UserRow('b', age=30).to_model(), User.make_factory(commit=False)('c', age=30)):
+            with self.assertRaises(AttributeError):
+                user.is_adult
+
+    def test_update_fields_without_age_keeps_value(self):
+        user = User.objects.create(username='a', age=30)
+        user.first_name = 'Ann'
+        with self.assertNumQueries(1):
+            user.save(update_fields=['first_name'])
+            self.assertTrue(user.is_adult)
+
+    def test_update_fields_with_age_reloads_value(self):
+        user = User.objects.create(username='a', age=30)
+        user.age = 10
+        user.save(update_fields=['age'])
+        self.assertFalse(user.is_adult)
+
+    def test_filter_in_sql(self):
+        User.bulk_create_users([{'username': 'a', 'age': 30}, {'username': 'b', 'age': 10}, {'username': 'c'}])
+        self.assertQuerySetEqual(User.objects.filter(is_adult=True), ['a'], transform=lambda u: u.username)
+
+
+class UserEqualityTests(TestCase):
+    def test_unsaved_users_compare_by_identity(self):
+        a, b = User(username='a'), User(username='b')
+        self.assertEqual(a, a)
+        self.assertNotEqual(a, b)
+        self.assertEqual(len({a, b}), 2)
+
+    def test_staging_by_username_survives_bulk_create(self):
+        staged = {}
+        for name in ['a', 'b', 'a']:
+            staged.setdefault(name, UserRow(name).to_model())
+        User.bulk_create_users(staged.values())
+        self.assertEqual(sorted(staged), ['a', 'b'])
+        self.assertEqual(staged['a'], User.objects.get(username='a'))
+
+    def test_bulk_create_changes_hash_of_staged_instances(self):
+        # Why staging collections are keyed by username: inserting assigns a pk and the identity hash is gone
+        user = User(username='a')
+        staged = {user}
+        User.bulk_create_users([user])
+        self.assertIsNotNone(user.pk)
+        self.assertNotIn(user, staged)
+
+    def test_saved_users_compare_by_pk(self):
+        user = User.objects.create(username='a')
+        copy = User.objects.get(pk=user.pk)
+        self.assertEqual(user, copy)
+        self.assertEqual(len({user, copy}), 1)
+
+
+class UserConstraintTests(TestCase):
+    def test_empty_username_rejected_by_database(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.bulk_create_users([{'username': ''}])
+
+    def test_empty_username_rejected_by_validate_constraints(self):
+        with self.assertRaisesMessage(ValidationError, 'user_username_nonempty'):
+            User(username='').validate_constraints()
+
+    def test_full_clean_rejects_empty_username(self):
+        user = User(username='', first_name='a', last_name='b', email='a@b.cd')
+        with self.assertRaises(ValidationError) as ctx:
+            user.full_clean()
+        self.assertIn('username', ctx.exception.message_dict)
+
+
+class UserStreamTests(TestCase):
+    def test_streams_without_sorting(self):
+        User.bulk_create_users([{'username': 'a'}])
+        with CaptureQueriesContext(connection) as queries:
+            list(User.stream())
+        self.assertNotIn('ORDER BY', queries[0]['sql'])
+
+    def test_str_on_streamed_rows_needs_no_extra_queries(self):
+        User.bulk_create_users([{'username': 'a', 'first_name': 'Ann', 'last_name': 'Lee'}, {'username': 'b'}])
+        with self.assertNumQueries(1):
+            names = sorted(str(user) for user in User.stream())
+        self.assertEqual(names, ['Ann Lee', 'b'])
+
+
+class UserBulkCreateTests(TestCase):
+    def setUp(self):
+        cache.delete(USER_COUNT_CACHE_KEY)
+
+    def test_accepts_dicts_and_instances(self):
+        factory = User.make_factory(commit=False, email='x@y.z')
+        rows = [{'username': 'a'}, factory('b'), UserRow('c', age=30).to_model()]
+        with self.captureOnCommitCallbacks(execute=True):
+            created = User.bulk_create_users(rows)
+        self.assertEqual(len(created), 3)
+        self.assertEqual(User.get_user_count(), 3)
+        self.assertEqual(User.objects.get(username='b').email, 'x@y.z')
+        self.assertEqual(User.objects.get(username='c').age, 30)
+
+
+class UserFullNameTests(TestCase):
+    def test_both_names(self):
+        user = User(username='u', first_name='Ann', last_name='Lee')
+        self.assertEqual(user.full_name, 'Ann Lee')
+        self.assertEqual(user.get_full_name(), 'Ann Lee')
+        self.assertEqual(str(user), 'Ann Lee')
+
+    def test_one_name(self):
+        self.assertEqual(User(username='u', first_name='Ann').full_name, 'Ann')
+        self.assertEqual(User(username='u', last_name='Lee').full_name, 'Lee')
+
+    def test_no_names_falls_back_to_username(self):
+        self.assertEqual(User(username='u').full_name, 'u')
+
+    def test_save_drops_cached_value(self):
+        user = User.objects.create(username='u', first_name='Ann')
+        self.assertEqual(user.full_name, 'Ann')
+        user.last_name = 'Lee'
+        user.save()
+        self.assertEqual(user.full_name, 'Ann Lee')
+
+    def test_refresh_from_db_drops_cached_value(self):
+        user = User.objects.create(username='u', first_name='Ann')
+        self.assertEqual(user.full_name, 'Ann')
+        User.objects.filter(pk=user.pk).update(last_name='Lee')
+        user.refresh_from_db()
+        self.assertEqual(user.full_name, 'Ann Lee')
+
+
+class UserBulkSetAgeTests(TestCase):
+    @mock.patch('user.models.fast_update', None)
+    def test_bulk_update_fallback(self):
+        User.bulk_create_users([{'username': 'a', 'age': 10}, {'username': 'b', 'age': 40}, {'username': 'c'}])
+        ids = dict(User.objects.values_list('username', 'id'))
+        User.bulk_set_age([(ids['a'], 20), (ids['b'], 5)])
+        self.assertEqual(
+            dict(User.objects.values_list('username', 'age')),
+            {'a': 20, 'b': 5, 'c': None},
+        )
+
+    @mock.patch('user.models.fast_update', None)
+    def test_is_adult_follows_new_ages(self):
+        User.bulk_create_users([{'username': 'a', 'age': 10}, {'username': 'b', 'age': 40}])
+        ids = dict(User.objects.values_list('username', 'id'))
+        User.bulk_set_age([(ids['a'], 20), (ids['b'], 5)])
+        self.assertEqual(
+            dict(User.objects.values_list('username', 'is_adult')),
+            {'a': True, 'b': False},
+        )
+
+
+class UserIterTests(TestCase):
+    def test_yields_six_values_in_order(self):
+        user = User.objects.create(username='u', first_name='Ann', last_name='Lee', email='a@x.z', age=30)
+        self.assertEqual(tuple(user), ('Ann', 'Lee', 'u', 'a@x.z', user.date_joined, 30))
 
-# Create your tests here.
+    def test_deferred_fields_are_loaded(self):
+        created = User.objects.create(username='u', first_name='Ann', last_name='Lee', email='a@x.z', age=30)
+        user = User.objects.only('id', 'username').get()
+        self.assertEqual(tuple(user), ('Ann', 'Lee', 'u', 'a@x.z', created.date_joined, 30))